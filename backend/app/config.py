@@ -9,9 +9,14 @@ class Settings(BaseSettings):
     mysql_user: str = "grader"
     mysql_password: str = "graderpass"
     mysql_database: str = "autograder"
+    mysql_pool_size: int = 20
+    mysql_pool_timeout: float = 2.0
     
     # Redis
     redis_url: str = "redis://localhost:6379/0"
+    grade_cache_ttl: int = 86400
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.95
     
     # MinIO
     minio_endpoint: str = "localhost:9000"
@@ -23,6 +28,7 @@ class Settings(BaseSettings):
     # Qdrant
     qdrant_host: str = "localhost"
     qdrant_port: int = 6333
+    qdrant_grpc_port: int = 6334
     qdrant_collection: str = "reference_docs"
     
     # LLM
@@ -31,19 +37,25 @@ class Settings(BaseSettings):
     openai_model: str = "gpt-4-turbo-preview"
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "llama2"
+    llm_max_connections: int = 100  # match the llm worker's -c concurrency
+    
+    # Text extraction
+    pdf_backend: str = "pymupdf"  # or "pypdfium2"
     
     # Embeddings
     embedding_model: str = "all-MiniLM-L6-v2"
+    embedding_cache_ttl: int = 604800
     
     # API
     api_host: str = "0.0.0.0"
     api_port: int = 8000
+    api_threadpool_size: int = 200
     
     class Config:
         env_file = ".env"
         case_sensitive = False
 
 
-@lru_cache()
+@lru_cache(maxsize=None)
 def get_settings() -> Settings:
     return Settings()
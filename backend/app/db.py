@@ -1,22 +1,43 @@
-import mysql.connector
-from mysql.connector import Error
+import time
+import orjson
+from functools import lru_cache
+import MySQLdb
+import MySQLdb.cursors
+from MySQLdb import Error
+from dbutils.pooled_db import PooledDB, TooManyConnections
 from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 from app.config import get_settings
 
 settings = get_settings()
 
+pool = PooledDB(
+    creator=MySQLdb,
+    mincached=0,  # connect lazily: prefork children must not share sockets opened at import
+    maxcached=settings.mysql_pool_size,
+    maxconnections=settings.mysql_pool_size,
+    blocking=False,
+    ping=1,  # check liveness whenever a connection is taken from the pool
+    host=settings.mysql_host,
+    port=settings.mysql_port,
+    user=settings.mysql_user,
+    passwd=settings.mysql_password,
+    db=settings.mysql_database,
+    charset="utf8mb4",
+    autocommit=False
+)
+
 
 def get_connection():
-    """Create a new database connection."""
-    return mysql.connector.connect(
-        host=settings.mysql_host,
-        port=settings.mysql_port,
-        user=settings.mysql_user,
-        password=settings.mysql_password,
-        database=settings.mysql_database,
-        autocommit=False
-    )
+    """Borrow a connection from the pool, waiting at most mysql_pool_timeout seconds."""
+    deadline = time.monotonic() + settings.mysql_pool_timeout
+    while True:
+        try:
+            return pool.connection()
+        except TooManyConnections:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.01)
 
 
 @contextmanager
@@ -26,7 +47,9 @@ def get_db_cursor(dictionary=True):
     cursor = None
     try:
         conn = get_connection()
-        cursor = conn.cursor(dictionary=dictionary)
+        cursor = conn.cursor(
+            MySQLdb.cursors.DictCursor if dictionary else MySQLdb.cursors.Cursor
+        )
         yield cursor
         conn.commit()
     except Error as e:
@@ -40,6 +63,16 @@ def get_db_cursor(dictionary=True):
             conn.close()
 
 
+@lru_cache(maxsize=1024)
+def _parse_json(raw_json: str) -> Any:
+    """Parse a stored JSON column.
+
+    Keyed on the raw column text, so identical rubrics/grades are parsed once.
+    The returned object is shared between callers and must not be mutated.
+    """
+    return orjson.loads(raw_json)
+
+
 def init_database():
     """Initialize database schema."""
     schema_sql = """
@@ -74,15 +107,16 @@ def init_database():
         citations JSON NOT NULL,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (submission_id) REFERENCES submissions(id) ON DELETE CASCADE,
-        INDEX idx_submission_id (submission_id),
         INDEX idx_created_at (created_at)
     );
     """
     
-    with get_db_cursor() as cursor:
-        for statement in schema_sql.split(';'):
-            if statement.strip():
-                cursor.execute(statement)
+    # Send the whole schema in one round trip (mysqlclient enables
+    # multi-statements by default) and drain every statement's result
+    with get_db_cursor(dictionary=False) as cursor:
+        cursor.execute(schema_sql)
+        while cursor.nextset():
+            pass
 
 
 def execute_query(query: str, params: tuple = None, fetch_one: bool = False, 
@@ -105,8 +139,7 @@ def insert_assignment(title: str, rubric: dict) -> int:
         INSERT INTO assignments (title, rubric)
         VALUES (%s, %s)
     """
-    import json
-    return execute_query(query, (title, json.dumps(rubric)))
+    return execute_query(query, (title, orjson.dumps(rubric).decode()))
 
 
 def get_assignment(assignment_id: int) -> Optional[Dict]:
@@ -114,8 +147,7 @@ def get_assignment(assignment_id: int) -> Optional[Dict]:
     query = "SELECT * FROM assignments WHERE id = %s"
     result = execute_query(query, (assignment_id,), fetch_one=True)
     if result:
-        import json
-        result['rubric'] = json.loads(result['rubric'])
+        result['rubric'] = _parse_json(result['rubric'])
     return result
 
 
@@ -123,12 +155,17 @@ def get_all_assignments() -> List[Dict]:
     """Get all assignments."""
     query = "SELECT * FROM assignments ORDER BY created_at DESC"
     results = execute_query(query, fetch_all=True)
-    import json
     for result in results:
-        result['rubric'] = json.loads(result['rubric'])
+        result['rubric'] = _parse_json(result['rubric'])
     return results
 
 
+def get_all_assignments_summary() -> List[Dict]:
+    """Get id, title and creation time of all assignments, without rubrics."""
+    query = "SELECT id, title, created_at FROM assignments ORDER BY created_at DESC"
+    return execute_query(query, fetch_all=True)
+
+
 def insert_submission(assignment_id: int, filename: str, s3_key: str, 
                      extracted_text: str) -> int:
     """Insert a new submission."""
@@ -139,12 +176,63 @@ def insert_submission(assignment_id: int, filename: str, s3_key: str,
     return execute_query(query, (assignment_id, filename, s3_key, extracted_text))
 
 
+def bulk_insert_submissions(rows: List[tuple]) -> List[int]:
+    """Insert many submissions in one transaction.
+
+    Each row is (assignment_id, filename, s3_key, extracted_text). Returns the
+    new submission IDs in row order.
+    """
+    if not rows:
+        return []
+    
+    query = """
+        INSERT INTO submissions (assignment_id, filename, s3_key, extracted_text, status)
+        VALUES (%s, %s, %s, %s, 'queued')
+    """
+    # s3 keys are unique per upload, so they map rows back to their IDs;
+    # the assignment filter lets the lookup use idx_assignment_id
+    s3_keys = [row[2] for row in rows]
+    assignment_ids = sorted({row[0] for row in rows})
+    key_placeholders = ', '.join(['%s'] * len(s3_keys))
+    assignment_placeholders = ', '.join(['%s'] * len(assignment_ids))
+    with get_db_cursor() as cursor:
+        cursor.executemany(query, rows)
+        cursor.execute(
+            f"""SELECT id, s3_key FROM submissions
+                WHERE assignment_id IN ({assignment_placeholders})
+                AND s3_key IN ({key_placeholders})""",
+            tuple(assignment_ids) + tuple(s3_keys)
+        )
+        ids = {r['s3_key']: r['id'] for r in cursor.fetchall()}
+    return [ids[key] for key in s3_keys]
+
+
 def get_submission(submission_id: int) -> Optional[Dict]:
     """Get submission by ID."""
     query = "SELECT * FROM submissions WHERE id = %s"
     return execute_query(query, (submission_id,), fetch_one=True)
 
 
+def get_submission_with_grade(submission_id: int) -> Optional[Dict]:
+    """Get submission by ID together with its grade score and feedback, if graded."""
+    query = """
+        SELECT s.*, g.score, g.feedback
+        FROM submissions s
+        LEFT JOIN grades g ON s.id = g.submission_id
+        WHERE s.id = %s
+    """
+    return execute_query(query, (submission_id,), fetch_one=True)
+
+
+def get_submissions_by_ids(submission_ids: List[int]) -> List[Dict]:
+    """Get several submissions by ID."""
+    if not submission_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(submission_ids))
+    query = f"SELECT * FROM submissions WHERE id IN ({placeholders}) ORDER BY id"
+    return execute_query(query, tuple(submission_ids), fetch_all=True)
+
+
 def get_submissions_by_assignment(assignment_id: int) -> List[Dict]:
     """Get all submissions for an assignment."""
     query = """
@@ -170,22 +258,48 @@ def insert_grade(submission_id: int, score: int, breakdown: dict,
         INSERT INTO grades (submission_id, score, breakdown, feedback, citations)
         VALUES (%s, %s, %s, %s, %s)
     """
-    import json
     return execute_query(query, (
         submission_id,
         score,
-        json.dumps(breakdown),
+        orjson.dumps(breakdown).decode(),
         feedback,
-        json.dumps(citations)
+        orjson.dumps(citations).decode()
     ))
 
 
+def finalize_grading(submission_id: int, score: int, breakdown: dict,
+                     feedback: str, citations: list) -> int:
+    """Insert a grade and mark its submission done in one round trip and transaction.
+    
+    If the submission already has a grade it is kept, so a duplicate grading
+    run just marks the submission done. Returns the stored grade's ID.
+    """
+    query = """
+        INSERT INTO grades (submission_id, score, breakdown, feedback, citations)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id);
+        UPDATE submissions SET status = 'done' WHERE id = %s
+    """
+    with get_db_cursor() as cursor:
+        cursor.execute(query, (
+            submission_id,
+            score,
+            orjson.dumps(breakdown).decode(),
+            feedback,
+            orjson.dumps(citations).decode(),
+            submission_id
+        ))
+        grade_id = cursor.lastrowid
+        while cursor.nextset():
+            pass
+    return grade_id
+
+
 def get_grade_by_submission(submission_id: int) -> Optional[Dict]:
     """Get grade for a submission."""
     query = "SELECT * FROM grades WHERE submission_id = %s"
     result = execute_query(query, (submission_id,), fetch_one=True)
     if result:
-        import json
-        result['breakdown'] = json.loads(result['breakdown'])
-        result['citations'] = json.loads(result['citations'])
+        result['breakdown'] = _parse_json(result['breakdown'])
+        result['citations'] = _parse_json(result['citations'])
     return result
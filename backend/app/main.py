@@ -1,8 +1,10 @@
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from app.services.grading import load_model
+from app.services.embeddings import embedding_service
 
 from app.config import get_settings
 from app.db import init_database
@@ -13,6 +15,9 @@ settings = get_settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Startup: Size the threadpool that runs the sync (def) route handlers
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.api_threadpool_size
+
     # Startup: Initialize database
     print("Initializing database...")
     init_database()
@@ -23,6 +28,11 @@ async def lifespan(app: FastAPI):
     load_model()
     print("Grading model loaded successfully")
 
+    # Startup: Warm up embedding model
+    print("Warming up embedding model...")
+    embedding_service.warmup()
+    print("Embedding model ready")
+
     yield
 
     # Shutdown: cleanup if needed
@@ -1,13 +1,14 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request, Response
 from pydantic import BaseModel
 from typing import List, Dict, Any
-import json
 
 from app.db import (
     insert_assignment,
     get_assignment,
-    get_all_assignments
+    get_all_assignments,
+    get_all_assignments_summary
 )
+from app.routes.http_cache import make_etag, is_not_modified
 from app.services.storage import storage_service
 from app.services.extract import text_extractor
 from app.services.rag import rag_service
@@ -27,8 +28,14 @@ class AssignmentResponse(BaseModel):
     created_at: str
 
 
+class AssignmentSummary(BaseModel):
+    id: int
+    title: str
+    created_at: str
+
+
 @router.post("/", response_model=AssignmentResponse)
-async def create_assignment(assignment: AssignmentCreate):
+def create_assignment(assignment: AssignmentCreate):
     """Create a new assignment with rubric."""
     try:
         assignment_id = insert_assignment(
@@ -48,7 +55,7 @@ async def create_assignment(assignment: AssignmentCreate):
 
 
 @router.get("/", response_model=List[AssignmentResponse])
-async def list_assignments():
+def list_assignments():
     """List all assignments."""
     try:
         assignments = get_all_assignments()
@@ -65,13 +72,36 @@ async def list_assignments():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/summary", response_model=List[AssignmentSummary])
+def list_assignment_summaries():
+    """List all assignments without their rubrics."""
+    try:
+        assignments = get_all_assignments_summary()
+        return [
+            AssignmentSummary(
+                id=a['id'],
+                title=a['title'],
+                created_at=str(a['created_at'])
+            )
+            for a in assignments
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{assignment_id}", response_model=AssignmentResponse)
-async def get_assignment_detail(assignment_id: int):
+def get_assignment_detail(assignment_id: int, request: Request, response: Response):
     """Get assignment details."""
     assignment = get_assignment(assignment_id)
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     
+    # Assignments are immutable once created
+    etag = make_etag(assignment['id'], assignment['created_at'])
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    
     return AssignmentResponse(
         id=assignment['id'],
         title=assignment['title'],
@@ -81,7 +111,7 @@ async def get_assignment_detail(assignment_id: int):
 
 
 @router.post("/{assignment_id}/references")
-async def upload_reference_document(
+def upload_reference_document(
     assignment_id: int,
     file: UploadFile = File(...)
 ):
@@ -93,7 +123,7 @@ async def upload_reference_document(
             raise HTTPException(status_code=404, detail="Assignment not found")
         
         # Read file
-        file_data = await file.read()
+        file_data = file.file.read()
         
         # Extract text
         text = text_extractor.extract_text(file_data, file.filename)
@@ -1,18 +1,26 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+import orjson
 from app.services.grading import grade_answer
 
 from app.db import (
     insert_submission,
+    bulk_insert_submissions,
     get_submission,
+    get_submission_with_grade,
+    get_submissions_by_ids,
     get_submissions_by_assignment,
     get_grade_by_submission,
     get_assignment
 )
+from app.routes.http_cache import make_etag, is_not_modified
 from app.services.storage import storage_service
 from app.services.extract import text_extractor
-from app.worker.tasks import grade_submission as grade_submission_task
+from app.services.rag import rag_service
+from app.services.llm import llm_service
+from app.worker.tasks import enqueue_grading, grade_submissions_bulk
 
 router = APIRouter(prefix="/submissions", tags=["submissions"])
 
@@ -25,6 +33,7 @@ class SubmissionResponse(BaseModel):
     score: Optional[int] = None
     feedback: Optional[str] = None
     created_at: str
+    task_id: Optional[str] = None
 
 
 class GradeResponse(BaseModel):
@@ -64,7 +73,7 @@ class BertGradeResponse(BaseModel):
 
 
 @router.post("/", response_model=SubmissionResponse)
-async def create_submission(
+def create_submission(
     assignment_id: int,
     file: UploadFile = File(...)
 ):
@@ -76,7 +85,7 @@ async def create_submission(
             raise HTTPException(status_code=404, detail="Assignment not found")
 
         # Read file
-        file_data = await file.read()
+        file_data = file.file.read()
 
         # Upload to MinIO
         s3_key = storage_service.upload_file(file_data, file.filename)
@@ -93,7 +102,7 @@ async def create_submission(
         )
 
         # Enqueue grading task
-        grade_submission_task.delay(submission_id)
+        task = enqueue_grading(submission_id)
 
         # Get submission
         submission = get_submission(submission_id)
@@ -103,7 +112,8 @@ async def create_submission(
             assignment_id=submission['assignment_id'],
             filename=submission['filename'],
             status=submission['status'],
-            created_at=str(submission['created_at'])
+            created_at=str(submission['created_at']),
+            task_id=task.id
         )
 
     except ValueError as e:
@@ -112,8 +122,65 @@ async def create_submission(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/batch", response_model=List[SubmissionResponse])
+def create_submissions_batch(
+    assignment_id: int,
+    files: List[UploadFile] = File(...)
+):
+    """Upload several submissions at once and enqueue them for grading."""
+    try:
+        # Verify assignment exists
+        assignment = get_assignment(assignment_id)
+        if not assignment:
+            raise HTTPException(status_code=404, detail="Assignment not found")
+
+        # Read files
+        uploads = [(file.filename, file.file.read()) for file in files]
+
+        # Extract text one file at a time; the PDF backends are not thread-safe
+        texts = [
+            text_extractor.extract_text(file_data, filename)
+            for filename, file_data in uploads
+        ]
+
+        # Upload to MinIO
+        rows = [
+            (assignment_id, filename, storage_service.upload_file(file_data, filename), text)
+            for (filename, file_data), text in zip(uploads, texts)
+        ]
+
+        # Insert all submissions in one transaction
+        submission_ids = bulk_insert_submissions(rows)
+
+        # Enqueue grading tasks
+        group_result = grade_submissions_bulk(submission_ids)
+        task_ids = {
+            submission_id: result.id
+            for submission_id, result in zip(submission_ids, group_result.results)
+        }
+
+        return [
+            SubmissionResponse(
+                id=s['id'],
+                assignment_id=s['assignment_id'],
+                filename=s['filename'],
+                status=s['status'],
+                created_at=str(s['created_at']),
+                task_id=task_ids[s['id']]
+            )
+            for s in get_submissions_by_ids(submission_ids)
+        ]
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/assignment/{assignment_id}", response_model=List[SubmissionResponse])
-async def list_submissions(assignment_id: int):
+def list_submissions(assignment_id: int):
     """List all submissions for an assignment."""
     try:
         submissions = get_submissions_by_assignment(assignment_id)
@@ -134,33 +201,39 @@ async def list_submissions(assignment_id: int):
 
 
 @router.get("/{submission_id}", response_model=SubmissionResponse)
-async def get_submission_detail(submission_id: int):
+def get_submission_detail(submission_id: int):
     """Get submission details."""
-    submission = get_submission(submission_id)
+    submission = get_submission_with_grade(submission_id)
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
 
-    # Try to get grade
-    grade = get_grade_by_submission(submission_id)
-
     return SubmissionResponse(
         id=submission['id'],
         assignment_id=submission['assignment_id'],
         filename=submission['filename'],
         status=submission['status'],
-        score=grade['score'] if grade else None,
-        feedback=grade['feedback'] if grade else None,
+        score=submission['score'],
+        feedback=submission['feedback'],
         created_at=str(submission['created_at'])
     )
 
 
 @router.get("/{submission_id}/grade", response_model=GradeResponse)
-async def get_grade(submission_id: int):
+def get_grade(submission_id: int, request: Request, response: Response):
     """Get grade details for a submission."""
     grade = get_grade_by_submission(submission_id)
     if not grade:
         raise HTTPException(status_code=404, detail="Grade not found")
 
+    # Grades never change after they are written
+    headers = {
+        "ETag": make_etag(grade['id'], grade['created_at']),
+        "Cache-Control": "public, max-age=300"
+    }
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
     return GradeResponse(
         id=grade['id'],
         submission_id=grade['submission_id'],
@@ -172,13 +245,46 @@ async def get_grade(submission_id: int):
     )
 
 
+@router.get("/{submission_id}/grade/stream")
+def stream_grade_preview(submission_id: int):
+    """Stream an LLM grading preview as Server-Sent Events without storing it."""
+    submission = get_submission(submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+
+    assignment = get_assignment(submission['assignment_id'])
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    submission_text = submission['extracted_text']
+    context_chunks = rag_service.search_relevant_chunks(
+        assignment_id=assignment['id'],
+        query=submission_text[:500],
+        top_k=5
+    )
+
+    def events():
+        try:
+            for delta in llm_service.stream_grading(
+                submission_text=submission_text,
+                rubric=assignment['rubric'],
+                context_chunks=context_chunks
+            ):
+                yield b"data: " + orjson.dumps(delta) + b"\n\n"
+            yield b"event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield b"event: error\ndata: " + orjson.dumps(str(e)) + b"\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.post(
     "/grade",
     response_model=BertGradeResponse,
     summary="Grade a student answer",
     description="Compares a student answer to the correct answer using a fine-tuned DistilBERT model. Returns a similarity score between 0 and 1."
 )
-async def bert_grade_answer(payload: GradeRequest) -> BertGradeResponse:
+def bert_grade_answer(payload: GradeRequest) -> BertGradeResponse:
     """Grade a student answer against a correct answer using DistilBERT."""
     try:
         score = grade_answer(
@@ -0,0 +1,269 @@
+import redis
+import orjson
+import numpy as np
+import zstandard
+import uuid
+from typing import Any, Optional
+from app.config import get_settings
+
+settings = get_settings()
+
+# Values larger than this are stored zstd-compressed
+COMPRESS_THRESHOLD = 512
+
+# Delete a lock only if it still holds the caller's token
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Extend a lock the caller holds, or take it again if it expired unclaimed;
+# fails only if another caller holds it
+_REFRESH_LOCK = """
+local holder = redis.call("get", KEYS[1])
+if holder == ARGV[1] or not holder then
+    redis.call("set", KEYS[1], ARGV[1], "EX", ARGV[2])
+    return 1
+end
+return 0
+"""
+
+_RAW = b"\x00"
+_ZSTD = b"\x01"
+
+
+def _pack(value: bytes) -> bytes:
+    """Prefix a value with its encoding, compressing it if it is large."""
+    if len(value) > COMPRESS_THRESHOLD:
+        return _ZSTD + zstandard.ZstdCompressor(level=3).compress(value)
+    return _RAW + value
+
+
+def _unpack(packed: bytes) -> bytes:
+    """Inverse of _pack."""
+    if packed[:1] == _ZSTD:
+        return zstandard.ZstdDecompressor().decompress(packed[1:])
+    return packed[1:]
+
+
+def quantize_vector(vector) -> bytes:
+    """Encode a vector as a float16 scale followed by int8 codes."""
+    vector = np.asarray(vector, dtype=np.float32)
+    scale = np.float16(np.abs(vector).max() / 127) if vector.size else np.float16(0)
+    if not scale:
+        scale = np.float16(1)
+    codes = np.clip(np.round(vector / np.float32(scale)), -127, 127).astype(np.int8)
+    return scale.astype("<f2").tobytes() + codes.tobytes()
+
+
+def dequantize_vector(data: bytes) -> np.ndarray:
+    """Inverse of quantize_vector, up to rounding."""
+    scale = np.frombuffer(data[:2], dtype="<f2")[0]
+    return np.frombuffer(data[2:], dtype=np.int8).astype(np.float32) * np.float32(scale)
+
+
+class CacheService:
+    """Redis-backed cache shared by the API and all Celery workers.
+
+    Cache failures never fail the caller: errors are treated as misses.
+    """
+
+    def __init__(self):
+        self.client = redis.Redis.from_url(settings.redis_url)
+        self._release_lock = self.client.register_script(_RELEASE_LOCK)
+        self._refresh_lock = self.client.register_script(_REFRESH_LOCK)
+    
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Get a cached raw value, or None on a miss."""
+        try:
+            packed = self.client.get(key)
+        except redis.RedisError:
+            return None
+        return _unpack(packed) if packed is not None else None
+    
+    def set_bytes(self, key: str, value: bytes, ttl: int):
+        """Cache a raw value for ttl seconds."""
+        try:
+            self.client.setex(key, ttl, _pack(value))
+        except redis.RedisError:
+            pass
+    
+    def push_list(self, key: str, values: list):
+        """Append values to a list kept without expiry."""
+        try:
+            self.client.rpush(key, *[_pack(value) for value in values])
+        except redis.RedisError:
+            pass
+    
+    def get_list(self, key: str) -> Optional[list]:
+        """Get every value of a list, or None if Redis is unreachable."""
+        try:
+            return [_unpack(value) for value in self.client.lrange(key, 0, -1)]
+        except redis.RedisError:
+            return None
+    
+    def list_length(self, key: str) -> Optional[int]:
+        """Get the length of a list, or None if Redis is unreachable."""
+        try:
+            return self.client.llen(key)
+        except redis.RedisError:
+            return None
+    
+    def set_flag(self, key: str):
+        """Set a key that never expires."""
+        try:
+            self.client.set(key, b"1")
+        except redis.RedisError:
+            pass
+    
+    def has_flag(self, key: str) -> Optional[bool]:
+        """Check a key set by set_flag, or None if Redis is unreachable."""
+        try:
+            return bool(self.client.exists(key))
+        except redis.RedisError:
+            return None
+    
+    def delete(self, *keys: str):
+        """Remove keys."""
+        try:
+            self.client.delete(*keys)
+        except redis.RedisError:
+            pass
+    
+    def publish(self, channel: str, message: str):
+        """Publish a notification; subscribers that miss it fall back to polling."""
+        try:
+            self.client.publish(channel, message)
+        except redis.RedisError:
+            pass
+    
+    def acquire_lock(self, key: str, ttl: int) -> Optional[str]:
+        """Take a lock for ttl seconds; returns its token, or None if it is held.
+        
+        If Redis is unreachable the caller proceeds unlocked.
+        """
+        token = uuid.uuid4().hex
+        try:
+            if not self.client.set(key, token, nx=True, ex=ttl):
+                return None
+        except redis.RedisError:
+            pass
+        return token
+    
+    def refresh_lock(self, key: str, token: str, ttl: int) -> bool:
+        """Reset a lock's TTL; False if another caller has taken it since.
+        
+        If Redis is unreachable the caller carries on as its holder.
+        """
+        try:
+            return bool(self._refresh_lock(keys=[key], args=[token, ttl]))
+        except redis.RedisError:
+            return True
+    
+    def release_lock(self, key: str, token: str):
+        """Release a lock taken by acquire_lock, unless it expired and was retaken."""
+        try:
+            self._release_lock(keys=[key], args=[token])
+        except redis.RedisError:
+            pass
+    
+    def get_json(self, key: str) -> Optional[Any]:
+        """Get a cached JSON value, or None on a miss."""
+        raw = self.get_bytes(key)
+        return orjson.loads(raw) if raw is not None else None
+    
+    def set_json(self, key: str, value: Any, ttl: int):
+        """Cache a JSON-serializable value for ttl seconds."""
+        self.set_bytes(key, orjson.dumps(value), ttl)
+
+
+class SemanticGradeCache:
+    """Reuse the grade of a near-duplicate submission to the same assignment.
+
+    Submission embeddings are bucketed with random-hyperplane LSH. A lookup
+    reads the submission's bucket plus every bucket one bit away in a single
+    pipeline and reuses the most similar stored grade if its cosine
+    similarity reaches the configured threshold.
+    """
+
+    HASH_BITS = 16
+    BUCKET_CAPACITY = 32
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+        self._planes = None
+    
+    def lookup(self, assignment_id: int, embedding: list) -> Optional[tuple]:
+        """Find the most similar cached submission.
+        
+        Returns (grade, source submission id, similarity), or None.
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        bucket = self._bucket(vector)
+        buckets = [bucket] + [bucket ^ (1 << bit) for bit in range(self.HASH_BITS)]
+        
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for b in buckets:
+                pipe.lrange(self._key(assignment_id, b), 0, -1)
+            entries = [
+                _unpack(entry)
+                for bucket_entries in pipe.execute()
+                for entry in bucket_entries
+            ]
+        except redis.RedisError:
+            return None
+        
+        # Entries are the quantized embedding followed by the source JSON;
+        # one too short for this embedding size can't be compared
+        split = 2 + vector.shape[0]
+        entries = [e for e in entries if len(e) > split]
+        if not entries:
+            return None
+        
+        # Score the int8 codes directly and apply each entry's scale after
+        rows = np.frombuffer(
+            b"".join(e[:split] for e in entries), dtype=np.int8
+        ).reshape(len(entries), split)
+        scales = rows[:, :2].copy().view("<f2").astype(np.float32).ravel()
+        similarities = (rows[:, 2:].astype(np.float32) @ vector) * scales
+        best = int(np.argmax(similarities))
+        if similarities[best] < settings.semantic_cache_threshold:
+            return None
+        
+        source = orjson.loads(entries[best][split:])
+        return source["grade"], source["submission_id"], float(similarities[best])
+    
+    def store(self, assignment_id: int, submission_id: int, embedding: list, grade: Any):
+        """Cache a submission's grade under its embedding's bucket."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        key = self._key(assignment_id, self._bucket(vector))
+        source = orjson.dumps({"submission_id": submission_id, "grade": grade})
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.rpush(key, _pack(quantize_vector(vector) + source))
+            pipe.ltrim(key, -self.BUCKET_CAPACITY, -1)
+            pipe.expire(key, settings.grade_cache_ttl)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+    
+    def _bucket(self, vector: np.ndarray) -> int:
+        """Sign pattern of the vector against fixed random hyperplanes."""
+        if self._planes is None or self._planes.shape[1] != vector.shape[0]:
+            rng = np.random.default_rng(0)
+            self._planes = rng.standard_normal(
+                (self.HASH_BITS, vector.shape[0])
+            ).astype(np.float32)
+        bits = (self._planes @ vector) > 0
+        return int(bits @ (1 << np.arange(self.HASH_BITS)))
+    
+    @staticmethod
+    def _key(assignment_id: int, bucket: int) -> str:
+        return f"semgrade:v1:{settings.embedding_model}:{assignment_id}:{bucket}"
+
+
+cache_service = CacheService()
+semantic_grade_cache = SemanticGradeCache(cache_service.client)
@@ -1,8 +1,15 @@
+import queue
+import re
+import threading
+import numpy as np
+from concurrent.futures import Future
 from sentence_transformers import SentenceTransformer
 from app.config import get_settings
 
 settings = get_settings()
 
+_WORD_RE = re.compile(r'\S+')
+
 
 class EmbeddingService:
     def __init__(self):
@@ -10,25 +17,109 @@ class EmbeddingService:
     
     def embed_text(self, text: str) -> list:
         """Generate embedding for a single text."""
-        embedding = self.model.encode(text)
+        embedding = self.model.encode(
+            text,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
         return embedding.tolist()
     
     def embed_batch(self, texts: list) -> list:
         """Generate embeddings for multiple texts."""
-        embeddings = self.model.encode(texts)
-        return [emb.tolist() for emb in embeddings]
+        return self.model.encode(
+            texts,
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).tolist()
+    
+    def embed_document(self, text: str) -> list:
+        """Generate one embedding for a whole document of any length.
+        
+        The model truncates long inputs, so the document is embedded in
+        chunks and the normalized mean of the chunk embeddings is returned.
+        """
+        chunks = self.chunk_text(text, chunk_size=200, overlap=0) or [text]
+        embeddings = self.model.encode(
+            chunks,
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        mean = embeddings.mean(axis=0)
+        norm = np.linalg.norm(mean)
+        return (mean / norm if norm else mean).tolist()
     
     def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> list:
-        """Split text into overlapping chunks."""
-        words = text.split()
+        """Split text into overlapping chunks of chunk_size words."""
+        # Record word boundaries once and slice the original string per chunk
+        spans = [m.span() for m in _WORD_RE.finditer(text)]
         chunks = []
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk)
+        for i in range(0, len(spans), chunk_size - overlap):
+            last = min(i + chunk_size, len(spans)) - 1
+            chunks.append(text[spans[i][0]:spans[last][1]])
         
         return chunks
 
+    def warmup(self):
+        """Run one forward pass so the first real request doesn't pay lazy init."""
+        self.embed_text("warmup")
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent single-text embedding requests into batched encodes.
+    
+    Callers block on a Future while a background thread embeds every request
+    already queued, up to max_batch_size, with one model call. It never waits
+    for more: requests that arrive during an encode form the next batch, so a
+    lone request pays no extra latency.
+    """
+    
+    def __init__(self, service: EmbeddingService, max_batch_size: int = 32):
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def embed(self, text: str) -> list:
+        """Generate embedding for a single text as part of the next batch."""
+        future = Future()
+        self._queue.put((text, future))
+        self._ensure_worker()
+        return future.result()
+    
+    def _ensure_worker(self):
+        # Started lazily so each forked worker process gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                embeddings = self.service.embed_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+
 
 embedding_service = EmbeddingService()
+embedding_batcher = EmbeddingBatcher(embedding_service)
@@ -1,6 +1,14 @@
-import PyPDF2
+import pymupdf
 from docx import Document
 from io import BytesIO
+from app.config import get_settings
+import threading
+
+settings = get_settings()
+
+# PyMuPDF and PDFium are not thread-safe; requests on the API threadpool
+# extract PDFs one at a time
+_PDF_LOCK = threading.Lock()
 
 
 class TextExtractor:
@@ -8,18 +16,39 @@ class TextExtractor:
     def extract_from_pdf(file_data: bytes) -> str:
         """Extract text from PDF file."""
         try:
-            pdf_file = BytesIO(file_data)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            with _PDF_LOCK:
+                if settings.pdf_backend == "pypdfium2":
+                    return TextExtractor._extract_pdf_pdfium(file_data)
+                
+                with pymupdf.open(stream=file_data, filetype="pdf") as doc:
+                    text = []
+                    for page in doc:
+                        page_text = page.get_text("text")
+                        if page_text:
+                            text.append(page_text)
             
+            return '\n'.join(text)
+        except Exception as e:
+            raise Exception(f"Failed to extract PDF text: {e}")
+    
+    @staticmethod
+    def _extract_pdf_pdfium(file_data: bytes) -> str:
+        """Extract text from PDF file using PDFium."""
+        import pypdfium2
+        
+        pdf = pypdfium2.PdfDocument(file_data)
+        try:
             text = []
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
+            for page in pdf:
+                textpage = page.get_textpage()
+                page_text = textpage.get_text_range()
+                textpage.close()
+                page.close()
                 if page_text:
                     text.append(page_text)
-            
             return '\n'.join(text)
-        except Exception as e:
-            raise Exception(f"Failed to extract PDF text: {e}")
+        finally:
+            pdf.close()
     
     @staticmethod
     def extract_from_docx(file_data: bytes) -> str:
@@ -48,20 +77,21 @@ class TextExtractor:
     @staticmethod
     def extract_text(file_data: bytes, filename: str) -> str:
         """Extract text based on file extension."""
-        extension = filename.split('.')[-1].lower() if '.' in filename else ''
-        
-        extractors = {
-            'pdf': TextExtractor.extract_from_pdf,
-            'docx': TextExtractor.extract_from_docx,
-            'doc': TextExtractor.extract_from_docx,
-            'txt': TextExtractor.extract_from_txt,
-        }
+        _, dot, extension = filename.rpartition('.')
+        extension = extension.lower() if dot else ''
         
-        extractor = extractors.get(extension)
+        extractor = TextExtractor._EXTRACTORS.get(extension)
         if not extractor:
             raise ValueError(f"Unsupported file type: {extension}")
         
         return extractor(file_data)
 
 
+TextExtractor._EXTRACTORS = {
+    'pdf': TextExtractor.extract_from_pdf,
+    'docx': TextExtractor.extract_from_docx,
+    'doc': TextExtractor.extract_from_docx,
+    'txt': TextExtractor.extract_from_txt,
+}
+
 text_extractor = TextExtractor()
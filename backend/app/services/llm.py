@@ -1,69 +1,100 @@
 from app.config import get_settings
-import json
-from typing import Dict, Any
+import httpx
+import orjson
+import re
+from functools import lru_cache
+from typing import Dict, Any, Iterator, Optional
 
 settings = get_settings()
 
+# Leading ``` / ```json and trailing ``` markdown fences around a response
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def render_rubric_prefix(rubric_json: str) -> str:
+    """Render the rubric part of the user prompt from the rubric's JSON.
+    
+    It is identical for every submission to an assignment, so it is rendered
+    once per rubric and kept at the start of the prompt, where providers'
+    prompt prefix caching can reuse it.
+    """
+    rubric_text = orjson.dumps(orjson.loads(rubric_json), option=orjson.OPT_INDENT_2).decode()
+    
+    return f"""Grade the following submission.
+
+RUBRIC:
+{rubric_text}
+
+"""
+
 
 class LLMService:
+    # Sampling parameters of every grading call
+    TEMPERATURE = 0.3
+    MAX_TOKENS = 2000
+    
     def __init__(self):
         self.provider = settings.llm_provider
         
+        # One keep-alive connection pool shared by every call from this
+        # process, with a connection per greenlet of an eventlet llm worker
+        self._http_client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=settings.llm_max_connections,
+                max_connections=settings.llm_max_connections
+            ),
+            # Long completions from slow models or CPU Ollama need a long
+            # read; a call waiting for a free connection queues, not fails
+            timeout=httpx.Timeout(60, read=300, pool=None)
+        )
+        
         if self.provider == "openai":
             from openai import OpenAI
-            self.client = OpenAI(api_key=settings.openai_api_key)
+            self.client = OpenAI(
+                api_key=settings.openai_api_key,
+                http_client=self._http_client
+            )
             self.model = settings.openai_model
         elif self.provider == "ollama":
             from openai import OpenAI
             self.client = OpenAI(
                 base_url=settings.ollama_base_url,
-                api_key="ollama"  # Ollama doesn't require a real key
+                api_key="ollama",  # Ollama doesn't require a real key
+                http_client=self._http_client
             )
             self.model = settings.ollama_model
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}")
     
     def grade_submission(self, submission_text: str, rubric: Dict, 
-                        context_chunks: list) -> Dict[str, Any]:
-        """Grade a submission using LLM with RAG context."""
-        
-        # Build context from retrieved chunks
-        context = "\n\n".join([
-            f"[Reference {i+1}]: {chunk['text']}"
-            for i, chunk in enumerate(context_chunks)
-        ])
+                        context_chunks: list,
+                        rubric_prefix: Optional[str] = None) -> Dict[str, Any]:
+        """Grade a submission using LLM with RAG context.
         
-        # Build grading prompt
-        system_prompt = self._build_grading_prompt()
-        user_prompt = self._build_user_prompt(submission_text, rubric, context)
+        rubric_prefix is the render_rubric_prefix() output for rubric, if the
+        caller already has it.
+        """
+        messages = self._build_messages(submission_text, rubric, context_chunks, rubric_prefix)
         
         # Call LLM
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000
+                messages=messages,
+                temperature=self.TEMPERATURE,
+                max_tokens=self.MAX_TOKENS
             )
             
             # Extract and parse JSON response
-            response_text = response.choices[0].message.content.strip()
-            
-            # Remove markdown code blocks if present
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
+            response_text = response.choices[0].message.content
             
-            response_text = response_text.strip()
-            
-            # Parse JSON
-            result = json.loads(response_text)
+            # Only strip markdown code blocks if the raw response doesn't parse
+            try:
+                result = orjson.loads(response_text)
+            except orjson.JSONDecodeError:
+                result = orjson.loads(_FENCE_RE.sub('', response_text))
             
             # Validate required fields
             required_fields = ["score", "breakdown", "feedback", "citations"]
@@ -73,11 +104,42 @@ class LLMService:
             
             return result
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise Exception(f"LLM returned invalid JSON: {e}")
         except Exception as e:
             raise Exception(f"LLM grading failed: {e}")
     
+    def stream_grading(self, submission_text: str, rubric: Dict,
+                       context_chunks: list) -> Iterator[str]:
+        """Grade a submission, yielding the raw JSON response as it is generated."""
+        messages = self._build_messages(submission_text, rubric, context_chunks)
+        
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.TEMPERATURE,
+            max_tokens=self.MAX_TOKENS,
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    def _build_messages(self, submission_text: str, rubric: Dict,
+                        context_chunks: list,
+                        rubric_prefix: Optional[str] = None) -> list:
+        """Build the chat messages for grading a submission."""
+        # Build context from retrieved chunks
+        context = "\n\n".join([
+            f"[Reference {i+1}]: {chunk['text']}"
+            for i, chunk in enumerate(context_chunks)
+        ])
+        
+        return [
+            {"role": "system", "content": self._build_grading_prompt()},
+            {"role": "user", "content": self._build_user_prompt(submission_text, rubric, context, rubric_prefix)}
+        ]
+    
     def _build_grading_prompt(self) -> str:
         """Build the system prompt for grading."""
         return """You are an expert grading assistant for academic submissions.
@@ -114,16 +176,12 @@ DO NOT use markdown code blocks.
 DO NOT add commentary before or after the JSON."""
 
     def _build_user_prompt(self, submission_text: str, rubric: Dict, 
-                          context: str) -> str:
+                          context: str, rubric_prefix: Optional[str] = None) -> str:
         """Build the user prompt with submission, rubric, and context."""
-        rubric_text = json.dumps(rubric, indent=2)
+        if rubric_prefix is None:
+            rubric_prefix = render_rubric_prefix(orjson.dumps(rubric).decode())
         
-        return f"""Grade the following submission.
-
-RUBRIC:
-{rubric_text}
-
-REFERENCE CONTEXT:
+        return f"""{rubric_prefix}REFERENCE CONTEXT:
 {context}
 
 SUBMISSION TO GRADE:
@@ -1,87 +1,204 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    MatchValue,
+    PayloadSchemaType,
+    PointStruct,
+    VectorParams,
+)
 from app.config import get_settings
-from app.services.embeddings import embedding_service
-import uuid
+from app.services.cache import cache_service, dequantize_vector, quantize_vector
+from app.services.embeddings import embedding_service, embedding_batcher
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import itertools
+import numpy as np
+import orjson
+import os
+import secrets
+import threading
 
 settings = get_settings()
 
+# Chunks embedded and upserted per round while indexing a document
+INDEX_BATCH_SIZE = 64
+
+# Assignments with up to this many reference chunks are searched in memory
+# from the copy pinned in Redis; larger ones are searched in Qdrant
+PINNED_MAX_CHUNKS = 5000
+
+# Memory each process may spend on loaded pinned reference sets
+PINNED_CACHE_BYTES = 256 * 1024 * 1024
+
+# Integer point IDs: each process draws a random 43-bit prefix and counts
+# points in the low 20 bits: IDs stay under 2**63, and processes, replicas
+# and restarts collide only if two draw the same prefix (~2**-43 per pair)
+_next_point_id = None
+_next_point_id_pid = None
+
+
+def _new_point_id() -> int:
+    """Next point ID, seeding the counter on first use in each process."""
+    global _next_point_id, _next_point_id_pid
+    if _next_point_id_pid != os.getpid():
+        _next_point_id = itertools.count(secrets.randbits(43) << 20)
+        _next_point_id_pid = os.getpid()
+    return next(_next_point_id)
+
+
+def _assignment_filter(assignment_id: int) -> Filter:
+    """Filter matching the points of a single assignment."""
+    return Filter(
+        must=[FieldCondition(key="assignment_id", match=MatchValue(value=assignment_id))]
+    )
+
 
 class RAGService:
     def __init__(self):
-        self.client = QdrantClient(
-            host=settings.qdrant_host,
-            port=settings.qdrant_port
-        )
         self.collection_name = settings.qdrant_collection
-        self._ensure_collection()
+        
+        # The gRPC channel must not cross fork(), so each process builds its
+        # own client on first use (see client)
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+        
+        # assignment_id -> (pinned list length, vectors or None, payloads, size)
+        self._pinned = {}
+        self._pinned_bytes = 0
+        self._pinned_lock = threading.Lock()
+    
+    @property
+    def client(self) -> QdrantClient:
+        """This process's Qdrant client, connecting and bootstrapping on first use."""
+        if self._client_pid != os.getpid():
+            with self._client_lock:
+                if self._client_pid != os.getpid():
+                    client = QdrantClient(
+                        host=settings.qdrant_host,
+                        port=settings.qdrant_port,
+                        grpc_port=settings.qdrant_grpc_port,
+                        prefer_grpc=True,
+                        timeout=30
+                    )
+                    self._ensure_collection(client)
+                    self._client = client
+                    self._client_pid = os.getpid()
+        return self._client
     
-    def _ensure_collection(self):
-        """Create collection if it doesn't exist."""
-        collections = self.client.get_collections().collections
+    def _ensure_collection(self, client: QdrantClient):
+        """Create collection and its assignment_id payload index if missing."""
+        collections = client.get_collections().collections
         collection_names = [c.name for c in collections]
         
         if self.collection_name not in collection_names:
             # Get vector dimension from embedding model
-            sample_embedding = embedding_service.embed_text("sample")
-            vector_size = len(sample_embedding)
+            vector_size = embedding_service.model.get_sentence_embedding_dimension()
             
-            self.client.create_collection(
+            client.create_collection(
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(
                     size=vector_size,
                     distance=Distance.COSINE
                 )
             )
+        
+        # Index the filter field so filtered search prunes by assignment
+        # instead of scanning the whole collection (idempotent)
+        client.create_payload_index(
+            collection_name=self.collection_name,
+            field_name="assignment_id",
+            field_schema=PayloadSchemaType.INTEGER
+        )
     
     def index_document(self, assignment_id: int, text: str, metadata: dict = None):
         """Chunk and index a reference document."""
         # Chunk the text
         chunks = embedding_service.chunk_text(text)
         
-        # Generate embeddings
-        embeddings = embedding_service.embed_batch(chunks)
-        
-        # Create points for Qdrant
-        points = []
-        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            point_id = str(uuid.uuid4())
-            payload = {
-                "assignment_id": assignment_id,
-                "chunk_index": idx,
-                "text": chunk,
-                **(metadata or {})
-            }
+        # Embed each batch while the previous one is being upserted; a single
+        # upload thread keeps batches in order and at most one in flight
+        pending = None
+        pinned_entries = []
+        with ThreadPoolExecutor(max_workers=1) as uploader:
+            for start in range(0, len(chunks), INDEX_BATCH_SIZE):
+                batch = chunks[start:start + INDEX_BATCH_SIZE]
+                embeddings = embedding_service.embed_batch(batch)
+                
+                # Create points for Qdrant and entries for the pinned copy
+                points = []
+                for idx, (chunk, embedding) in enumerate(zip(batch, embeddings), start):
+                    point_id = _new_point_id()
+                    payload = {
+                        "assignment_id": assignment_id,
+                        "chunk_index": idx,
+                        "text": chunk,
+                        **(metadata or {})
+                    }
+                    
+                    points.append(PointStruct(
+                        id=point_id,
+                        vector=embedding,
+                        payload=payload
+                    ))
+                    pinned_entries.append(
+                        np.asarray(embedding, dtype="<f2").tobytes() + orjson.dumps(payload)
+                    )
+                
+                # Upsert to Qdrant
+                if pending:
+                    pending.result()
+                pending = uploader.submit(
+                    self.client.upsert,
+                    collection_name=self.collection_name,
+                    points=points
+                )
             
-            points.append(PointStruct(
-                id=point_id,
-                vector=embedding,
-                payload=payload
-            ))
-        
-        # Upsert to Qdrant
-        if points:
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            if pending:
+                pending.result()
         
-        return len(points)
+        # Pin the chunks only once Qdrant has them all, so a pinned set never
+        # holds chunks the vector search wouldn't find
+        if pinned_entries:
+            self._pin(assignment_id, pinned_entries)
+        
+        return len(chunks)
     
-    def search_relevant_chunks(self, assignment_id: int, query: str, top_k: int = 5):
-        """Search for relevant chunks for a given query."""
+    def search_relevant_chunks(self, assignment_id: int, query: str, top_k: int = 5,
+                               query_embedding: list = None):
+        """Search for relevant chunks for a given query.
+        
+        Pass query_embedding if the query was already embedded with embed_query.
+        """
         # Generate query embedding
-        query_embedding = embedding_service.embed_text(query)
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        
+        # Small reference sets are searched in memory
+        pinned = self._load_pinned(assignment_id, len(query_embedding))
+        if pinned is not None:
+            vectors, payloads = pinned
+            scores = vectors @ np.asarray(query_embedding, dtype=np.float32)
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {
+                    "text": payloads[i].get("text", ""),
+                    "score": float(scores[i]),
+                    "metadata": {key: v for key, v in payloads[i].items() if key != "text"}
+                }
+                for i in top
+            ]
         
         # Search in Qdrant
         search_results = self.client.search(
             collection_name=self.collection_name,
             query_vector=query_embedding,
-            query_filter={
-                "must": [
-                    {"key": "assignment_id", "match": {"value": assignment_id}}
-                ]
-            },
+            query_filter=_assignment_filter(assignment_id),
             limit=top_k
         )
         
@@ -96,18 +213,108 @@ class RAGService:
         
         return results
     
+    def embed_query(self, query: str) -> list:
+        """Embed a search query, reusing the cached embedding of identical text."""
+        digest = hashlib.sha256(query.encode()).hexdigest()
+        key = f"emb:v1:{settings.embedding_model}:{digest}"
+        
+        cached = cache_service.get_bytes(key)
+        if cached is not None:
+            return dequantize_vector(cached).tolist()
+        
+        # Concurrent searches on the same worker share one batched encode
+        quantized = quantize_vector(embedding_batcher.embed(query))
+        cache_service.set_bytes(key, quantized, settings.embedding_cache_ttl)
+        
+        # Search with the vector a cache hit would return, so results for the
+        # same query don't depend on whether it was cached
+        return dequantize_vector(quantized).tolist()
+    
+    def _pin(self, assignment_id: int, entries: list):
+        """Append chunk entries to an assignment's pinned set.
+        
+        A set that would grow past PINNED_MAX_CHUNKS is never searched, so it
+        is dropped and the assignment is marked to stay in Qdrant only.
+        """
+        key = self._pinned_key(assignment_id)
+        overflow_key = self._overflow_key(assignment_id)
+        if cache_service.has_flag(overflow_key) is not False:
+            return
+        
+        length = cache_service.list_length(key)
+        if length is None:
+            return
+        if length + len(entries) > PINNED_MAX_CHUNKS:
+            cache_service.set_flag(overflow_key)
+            cache_service.delete(key)
+            return
+        
+        cache_service.push_list(key, entries)
+    
+    def _load_pinned(self, assignment_id: int, dimension: int):
+        """Get an assignment's pinned (vectors, payloads), or None to use Qdrant.
+        
+        Each process keeps the pinned sets it has loaded and checks them
+        against the Redis list length on every search, since uploads only
+        ever append to the list.
+        """
+        key = self._pinned_key(assignment_id)
+        length = cache_service.list_length(key)
+        if not length or length > PINNED_MAX_CHUNKS:
+            return None
+        
+        cached = self._pinned.get(assignment_id)
+        if cached is None or cached[0] != length:
+            entries = cache_service.get_list(key)
+            if entries is None:
+                return None
+            
+            # Documents indexed before pinning existed are only in Qdrant
+            indexed = self.client.count(
+                collection_name=self.collection_name,
+                count_filter=_assignment_filter(assignment_id),
+                exact=True
+            ).count
+            if indexed != len(entries):
+                cached = (len(entries), None, None, 0)
+            else:
+                split = 2 * dimension
+                vectors = np.frombuffer(
+                    b"".join(e[:split] for e in entries), dtype="<f2"
+                ).reshape(len(entries), dimension).astype(np.float32)
+                payloads = [orjson.loads(e[split:]) for e in entries]
+                # Payload dicts take roughly twice their JSON size
+                size = vectors.nbytes + 2 * sum(len(e) - split for e in entries)
+                cached = (len(entries), vectors, payloads, size)
+            
+            with self._pinned_lock:
+                previous = self._pinned.pop(assignment_id, None)
+                if previous is not None:
+                    self._pinned_bytes -= previous[3]
+                while self._pinned and self._pinned_bytes + cached[3] > PINNED_CACHE_BYTES:
+                    self._pinned_bytes -= self._pinned.pop(next(iter(self._pinned)))[3]
+                if cached[3] <= PINNED_CACHE_BYTES:
+                    self._pinned[assignment_id] = cached
+                    self._pinned_bytes += cached[3]
+        
+        _, vectors, payloads, _ = cached
+        return None if vectors is None else (vectors, payloads)
+    
+    @staticmethod
+    def _pinned_key(assignment_id: int) -> str:
+        return f"ref:{assignment_id}"
+    
+    @staticmethod
+    def _overflow_key(assignment_id: int) -> str:
+        return f"ref:{assignment_id}:overflow"
+    
     def delete_assignment_documents(self, assignment_id: int):
         """Delete all documents for an assignment."""
         self.client.delete(
             collection_name=self.collection_name,
-            points_selector={
-                "filter": {
-                    "must": [
-                        {"key": "assignment_id", "match": {"value": assignment_id}}
-                    ]
-                }
-            }
+            points_selector=FilterSelector(filter=_assignment_filter(assignment_id))
         )
+        cache_service.delete(self._pinned_key(assignment_id), self._overflow_key(assignment_id))
 
 
 rag_service = RAGService()
@@ -1,19 +1,55 @@
 from minio import Minio
 from minio.error import S3Error
 from io import BytesIO
+from typing import BinaryIO
+from urllib3.util.retry import Retry
 from app.config import get_settings
+import certifi
+import logging
+import os
+import urllib3
 import uuid
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Files from MULTIPART_THRESHOLD up are sent as parallel 16 MiB parts;
+# smaller files go in a single PUT (S3 parts must be at least 5 MiB)
+MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_THRESHOLD = 32 * 1024 * 1024
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+MULTIPART_PARALLEL_UPLOADS = 8
+
+_CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'txt': 'text/plain',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'doc': 'application/msword',
+}
 
 
 class StorageService:
     def __init__(self):
+        # Keep 64 connections alive for concurrent uploads; never block
+        # waiting for a free one and retry transient server errors
+        http_client = urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=300, read=300),
+            maxsize=64,
+            block=False,
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=Retry(
+                total=3,
+                backoff_factor=0.2,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+        )
         self.client = Minio(
             settings.minio_endpoint,
             access_key=settings.minio_access_key,
             secret_key=settings.minio_secret_key,
-            secure=settings.minio_secure
+            secure=settings.minio_secure,
+            http_client=http_client
         )
         self.bucket = settings.minio_bucket
         self._ensure_bucket()
@@ -23,50 +59,68 @@ class StorageService:
         try:
             if not self.client.bucket_exists(self.bucket):
                 self.client.make_bucket(self.bucket)
-        except S3Error as e:
-            print(f"Error creating bucket: {e}")
+        except S3Error:
+            logger.exception("Error creating bucket %s", self.bucket)
     
     def upload_file(self, file_data: bytes, filename: str) -> str:
         """Upload a file and return its S3 key."""
-        file_extension = filename.split('.')[-1] if '.' in filename else 'txt'
-        s3_key = f"{uuid.uuid4()}.{file_extension}"
+        file_extension = os.path.splitext(filename)[1][1:].lower() or 'txt'
+        s3_key = f"{uuid.uuid4().hex}.{file_extension}"
+        
+        length = len(file_data)
+        if length >= MULTIPART_THRESHOLD:
+            part_size, parallel_uploads = MULTIPART_PART_SIZE, MULTIPART_PARALLEL_UPLOADS
+        else:
+            # A single part holding the whole file is uploaded with one PUT
+            part_size, parallel_uploads = max(length, MIN_PART_SIZE), 1
         
         try:
+            # BytesIO shares file_data's buffer and hands it back uncopied when
+            # minio reads a single-part object in one go; minio requires read()
+            # to return bytes, so a memoryview-based stream cannot be used
             self.client.put_object(
                 self.bucket,
                 s3_key,
                 BytesIO(file_data),
-                length=len(file_data),
-                content_type=self._get_content_type(file_extension)
+                length=length,
+                content_type=self._get_content_type(file_extension),
+                part_size=part_size,
+                num_parallel_uploads=parallel_uploads
             )
             return s3_key
         except S3Error as e:
             raise Exception(f"Failed to upload file: {e}")
     
-    def download_file(self, s3_key: str) -> bytes:
-        """Download a file from storage."""
+    def open_stream(self, s3_key: str) -> BinaryIO:
+        """Open a file for streaming reads without buffering it in memory.
+        
+        The response supports read(n) and stream(chunk_size); callers must
+        close() and release_conn() it when done.
+        """
         try:
-            response = self.client.get_object(self.bucket, s3_key)
-            return response.read()
+            return self.client.get_object(self.bucket, s3_key)
         except S3Error as e:
             raise Exception(f"Failed to download file: {e}")
     
+    def download_file(self, s3_key: str) -> bytes:
+        """Download a whole file from storage."""
+        response = self.open_stream(s3_key)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    
     def delete_file(self, s3_key: str):
         """Delete a file from storage."""
         try:
             self.client.remove_object(self.bucket, s3_key)
-        except S3Error as e:
-            print(f"Error deleting file: {e}")
+        except S3Error:
+            logger.exception("Error deleting file %s", s3_key)
     
     def _get_content_type(self, extension: str) -> str:
-        """Get content type based on file extension."""
-        content_types = {
-            'pdf': 'application/pdf',
-            'txt': 'text/plain',
-            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'doc': 'application/msword',
-        }
-        return content_types.get(extension.lower(), 'application/octet-stream')
+        """Get content type based on a lowercased file extension."""
+        return _CONTENT_TYPES.get(extension, 'application/octet-stream')
 
 
 storage_service = StorageService()
@@ -1,5 +1,9 @@
 from celery import Celery
+from celery.signals import after_setup_logger, after_setup_task_logger, worker_process_init
+from logging.handlers import QueueHandler, QueueListener
 from app.config import get_settings
+import atexit
+import queue
 
 settings = get_settings()
 
@@ -16,9 +20,67 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    broker_transport_options={'socket_keepalive': True},
+    redis_socket_keepalive=True,
+    # The llm queue's workers run on an eventlet pool (-P eventlet -c 100):
+    # never cap broker connections below the greenlet count and let each
+    # greenlet reserve only the task it is running
+    broker_pool_limit=None,
+    worker_prefetch_multiplier=1,
+    # Each grading stage has its own queue so workers can be sized for its
+    # bottleneck. Only llm may run on eventlet: embed (the model and the
+    # Qdrant gRPC client) and db (mysqlclient) block in C and need prefork
     task_routes={
-        'app.worker.tasks.grade_submission': {'queue': 'grading'}
+        'app.worker.tasks.grade_submission': {'queue': 'grading'},
+        'app.worker.tasks.embed_submission': {'queue': 'embed'},
+        'app.worker.tasks.retrieve_context': {'queue': 'embed'},
+        'app.worker.tasks.llm_grade': {'queue': 'llm'},
+        'app.worker.tasks.persist_grade': {'queue': 'db'}
     }
 )
 
+
+# QueueHandlers installed by _log_through_queue, with the handlers they feed
+_queued_handlers = []
+
+
+def _start_listener(queue_handler: QueueHandler, handlers: list):
+    """Drain queue_handler's queue into handlers on a thread of this process."""
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+@after_setup_logger.connect
+@after_setup_task_logger.connect
+def _log_through_queue(logger, **kwargs):
+    """Move a logger's handlers behind a queue drained by a listener thread.
+    
+    Tasks only enqueue records, so they never block on stderr or file I/O.
+    queue.Queue (not SimpleQueue) is used because eventlet can green it.
+    """
+    handlers = logger.handlers[:]
+    if not handlers:
+        return
+    
+    queue_handler = QueueHandler(queue.Queue(-1))
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    _queued_handlers.append((queue_handler, handlers))
+    _start_listener(queue_handler, handlers)
+
+
+@worker_process_init.connect
+def _restart_log_listeners(**kwargs):
+    """Give each prefork child its own queues and listener threads.
+    
+    Children inherit the QueueHandlers but not the listener threads, and
+    Celery doesn't set up logging again in them.
+    """
+    for queue_handler, handlers in _queued_handlers:
+        queue_handler.queue = queue.Queue(-1)
+        _start_listener(queue_handler, handlers)
+
+
 from app.worker import tasks  # noqa: F401, E402
\ No newline at end of file
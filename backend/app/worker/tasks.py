@@ -1,28 +1,134 @@
+from celery import chain, group
 from app.worker.celery_app import celery_app
 from app.db import (
-    get_submission, 
-    update_submission_status, 
-    insert_grade,
-    get_assignment
+    get_submission,
+    update_submission_status,
+    finalize_grading,
+    get_assignment,
+    get_grade_by_submission
 )
+from app.config import get_settings
+from app.services.cache import cache_service, semantic_grade_cache
+from app.services.embeddings import embedding_service
 from app.services.rag import rag_service
-from app.services.llm import llm_service
-import traceback
+from app.services.llm import llm_service, render_rubric_prefix
+import functools
+import hashlib
+import logging
+import orjson
 
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
-@celery_app.task(name='app.worker.tasks.grade_submission')
-def grade_submission(submission_id: int):
+# Lifetime of a grading run's lock. Every stage renews it, so it bounds one
+# stage plus its wait in the next queue, and expires if a worker dies
+GRADING_LOCK_TTL = 600
+
+
+def _grading_cache_key(rubric: dict, submission_text: str, context_chunks: list) -> str:
+    """Key identifying an LLM grading call by everything that shapes its output.
+    
+    Only the chunk texts reach the prompt; their retrieval scores vary with
+    the query vector's precision and are left out.
+    """
+    payload = orjson.dumps({
+        "r": rubric,
+        "s": submission_text,
+        "c": [chunk['text'] for chunk in context_chunks],
+        "p": llm_service.provider,
+        "m": llm_service.model,
+        "t": llm_service.TEMPERATURE,
+        "n": llm_service.MAX_TOKENS
+    }, option=orjson.OPT_SORT_KEYS)
+    return "grade:v1:" + hashlib.sha256(payload).hexdigest()
+
+
+# Grading runs as a sequence of stages passing a JSON state dict along, so
+# that each stage can run as its own Celery task on a queue sized for its
+# bottleneck. A stage that sets state['result'] ends the run: later stages
+# pass the state through unchanged.
+
+def _lock_key(submission_id: int) -> str:
+    return f"lock:grade:{submission_id}"
+
+
+def _finish(state: dict, result: dict) -> dict:
+    """End a grading run with result and release its lock."""
+    if 'lock_token' in state:
+        cache_service.release_lock(_lock_key(state['submission_id']), state.pop('lock_token'))
+    state['result'] = result
+    return state
+
+
+def _fail(state: dict, e: Exception) -> dict:
+    """End a grading run that raised e, marking the submission as errored.
+    
+    Must be called while handling e, so its traceback is logged.
     """
-    Background task to grade a submission.
+    submission_id = state['submission_id']
+    logger.exception("Grading failed for submission %s", submission_id)
+    update_submission_status(submission_id, 'error')
+    cache_service.publish(f"submission:{submission_id}:status", 'error')
     
-    Steps:
-    1. Retrieve submission from database
-    2. Get assignment and rubric
-    3. Query RAG for relevant context
-    4. Call LLM to grade
-    5. Store grade in database
+    return _finish(state, {
+        'status': 'error',
+        'submission_id': submission_id,
+        'error': str(e)
+    })
+
+
+def _stage(func):
+    """Skip a stage for finished runs and turn its errors into a failed run."""
+    @functools.wraps(func)
+    def run(state: dict) -> dict:
+        if 'result' in state:
+            return state
+        
+        # A run that lost its lock to a duplicate leaves the grading to it
+        submission_id = state['submission_id']
+        if not cache_service.refresh_lock(
+            _lock_key(submission_id), state['lock_token'], GRADING_LOCK_TTL
+        ):
+            state.pop('lock_token')
+            state['result'] = {
+                'status': 'skipped',
+                'submission_id': submission_id
+            }
+            return state
+        
+        try:
+            return func(state)
+        except Exception as e:
+            return _fail(state, e)
+    return run
+
+
+def _claim_submission(submission_id: int) -> dict:
+    """Lock a submission for grading and load it into a new state.
+    
+    Redelivered or retried runs for the same submission are skipped while
+    one is in progress, and submissions that already have a grade are not
+    graded again.
     """
+    state = {'submission_id': submission_id}
+    lock_token = cache_service.acquire_lock(_lock_key(submission_id), GRADING_LOCK_TTL)
+    if lock_token is None:
+        state['result'] = {
+            'status': 'skipped',
+            'submission_id': submission_id
+        }
+        return state
+    state['lock_token'] = lock_token
+    
     try:
+        existing_grade = get_grade_by_submission(submission_id)
+        if existing_grade:
+            return _finish(state, {
+                'status': 'success',
+                'submission_id': submission_id,
+                'score': existing_grade['score']
+            })
+        
         # Update status to grading
         update_submission_status(submission_id, 'grading')
         
@@ -36,59 +142,164 @@ def grade_submission(submission_id: int):
         if not assignment:
             raise Exception(f"Assignment {submission['assignment_id']} not found")
         
-        # Extract data
-        submission_text = submission['extracted_text']
-        rubric = assignment['rubric']
-        assignment_id = assignment['id']
-        
-        # Retrieve relevant context from RAG
-        # Use first 500 chars of submission as query
-        query_text = submission_text[:500] if len(submission_text) > 500 else submission_text
-        context_chunks = rag_service.search_relevant_chunks(
-            assignment_id=assignment_id,
-            query=query_text,
-            top_k=5
+        state['assignment_id'] = assignment['id']
+        state['rubric'] = assignment['rubric']
+        state['submission_text'] = submission['extracted_text']
+        return state
+    
+    except Exception as e:
+        return _fail(state, e)
+
+
+@_stage
+def _embed(state: dict) -> dict:
+    """Reuse the grade of a near-duplicate submission, or embed the RAG query."""
+    submission_text = state['submission_text']
+    
+    if settings.semantic_cache_enabled:
+        state['submission_embedding'] = embedding_service.embed_document(submission_text)
+        cached = semantic_grade_cache.lookup(
+            state['assignment_id'], state['submission_embedding']
         )
-        
-        # Grade using LLM
+        if cached is not None:
+            # Say where the grade came from so a reviewer can check it
+            grading_result, source_id, similarity = cached
+            grading_result['feedback'] = (
+                f"[Grade reused from near-duplicate submission {source_id} "
+                f"(similarity {similarity:.3f}).]\n\n{grading_result['feedback']}"
+            )
+            state['grading_result'] = grading_result
+            return state
+    
+    # Use first 500 chars of submission as query
+    state['query_embedding'] = rag_service.embed_query(submission_text[:500])
+    return state
+
+
+@_stage
+def _retrieve(state: dict) -> dict:
+    """Retrieve relevant context from RAG."""
+    if 'grading_result' not in state:
+        state['context_chunks'] = rag_service.search_relevant_chunks(
+            assignment_id=state['assignment_id'],
+            query=state['submission_text'][:500],
+            top_k=5,
+            query_embedding=state.pop('query_embedding')
+        )
+    return state
+
+
+@_stage
+def _grade(state: dict) -> dict:
+    """Grade using LLM, reusing the result of an identical earlier call."""
+    if 'grading_result' in state:
+        return state
+    
+    rubric = state['rubric']
+    submission_text = state['submission_text']
+    context_chunks = state['context_chunks']
+    
+    cache_key = _grading_cache_key(rubric, submission_text, context_chunks)
+    grading_result = cache_service.get_json(cache_key)
+    if grading_result is None:
         grading_result = llm_service.grade_submission(
             submission_text=submission_text,
             rubric=rubric,
-            context_chunks=context_chunks
+            context_chunks=context_chunks,
+            rubric_prefix=render_rubric_prefix(orjson.dumps(rubric).decode())
         )
-        
-        # Extract grading components
-        score = grading_result['score']
-        breakdown = grading_result['breakdown']
-        feedback = grading_result['feedback']
-        citations = grading_result['citations']
-        
-        # Store grade in database
-        insert_grade(
-            submission_id=submission_id,
-            score=score,
-            breakdown=breakdown,
-            feedback=feedback,
-            citations=citations
+        cache_service.set_json(cache_key, grading_result, settings.grade_cache_ttl)
+    
+    if 'submission_embedding' in state:
+        semantic_grade_cache.store(
+            state['assignment_id'], state['submission_id'],
+            state['submission_embedding'], grading_result
         )
-        
-        # Update status to done
-        update_submission_status(submission_id, 'done')
-        
-        return {
-            'status': 'success',
-            'submission_id': submission_id,
-            'score': score
-        }
-        
-    except Exception as e:
-        # Update status to error
-        update_submission_status(submission_id, 'error')
-        error_msg = f"Grading failed: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
-        
-        return {
-            'status': 'error',
-            'submission_id': submission_id,
-            'error': str(e)
-        }
+    
+    state['grading_result'] = grading_result
+    return state
+
+
+@_stage
+def _persist(state: dict) -> dict:
+    """Store grade and update status to done in one transaction."""
+    submission_id = state['submission_id']
+    grading_result = state['grading_result']
+    
+    finalize_grading(
+        submission_id=submission_id,
+        score=grading_result['score'],
+        breakdown=grading_result['breakdown'],
+        feedback=grading_result['feedback'],
+        citations=grading_result['citations']
+    )
+    cache_service.publish(f"submission:{submission_id}:status", 'done')
+    
+    return _finish(state, {
+        'status': 'success',
+        'submission_id': submission_id,
+        'score': grading_result['score']
+    })
+
+
+@celery_app.task(name='app.worker.tasks.grade_submission')
+def grade_submission(submission_id: int):
+    """
+    Background task to grade a submission in a single worker.
+    
+    Steps:
+    1. Retrieve submission from database
+    2. Get assignment and rubric
+    3. Query RAG for relevant context
+    4. Call LLM to grade
+    5. Store grade in database
+    
+    enqueue_grading runs the same steps as a chain of per-stage tasks.
+    """
+    state = _claim_submission(submission_id)
+    for stage in (_embed, _retrieve, _grade, _persist):
+        state = stage(state)
+    return state['result']
+
+
+@celery_app.task(name='app.worker.tasks.embed_submission')
+def embed_submission(submission_id: int):
+    """Grading stage 1: load the submission and embed it."""
+    return _embed(_claim_submission(submission_id))
+
+
+@celery_app.task(name='app.worker.tasks.retrieve_context')
+def retrieve_context(state: dict):
+    """Grading stage 2: vector search for reference context."""
+    return _retrieve(state)
+
+
+@celery_app.task(name='app.worker.tasks.llm_grade')
+def llm_grade(state: dict):
+    """Grading stage 3: grade with the LLM."""
+    return _grade(state)
+
+
+@celery_app.task(name='app.worker.tasks.persist_grade')
+def persist_grade(state: dict):
+    """Grading stage 4: store the grade."""
+    return _persist(state)['result']
+
+
+def _grading_chain(submission_id: int):
+    return chain(
+        embed_submission.s(submission_id),
+        retrieve_context.s(),
+        llm_grade.s(),
+        persist_grade.s()
+    )
+
+
+def enqueue_grading(submission_id: int):
+    """Enqueue grading of a submission; the result is the final stage's."""
+    return _grading_chain(submission_id).apply_async()
+
+
+def grade_submissions_bulk(submission_ids: list):
+    """Enqueue grading for many submissions as one group dispatch."""
+    return group(_grading_chain(submission_id) for submission_id in submission_ids).apply_async()
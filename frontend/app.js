@@ -111,7 +111,7 @@ async function loadAssignments() {
 // Load Assignments for Dropdown
 async function loadAssignmentsForDropdown() {
     try {
-        const response = await fetch(`${API_BASE_URL}/assignments/`);
+        const response = await fetch(`${API_BASE_URL}/assignments/summary`);
         const assignments = await response.json();
         currentAssignments = assignments;
         
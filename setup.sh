@@ -84,7 +84,7 @@ echo "Next steps:"
 echo "1. Edit backend/.env and add your OpenAI API key (or configure Ollama)"
 echo "2. Install Python dependencies: cd backend && pip install -r requirements.txt"
 echo "3. Start the backend: uvicorn app.main:app --reload"
-echo "4. Start the worker: celery -A app.worker.celery_app worker -Q grading"
+echo "4. Start the worker: celery -A app.worker.celery_app worker -Q grading,embed,llm,db"
 echo "5. Open frontend/index.html in your browser"
 echo ""
 echo "For more details, see README.md"
@@ -5,17 +5,25 @@ Demonstrates API usage and validates the system is working
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+import redis
 import json
+import os
 import time
 from pathlib import Path
 
 API_BASE = "http://localhost:8000"
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+# One keep-alive session for every API call in the run
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
 
 
 def test_health():
     """Test API health endpoint"""
     print("🔍 Testing health endpoint...")
-    response = requests.get(f"{API_BASE}/health")
+    response = SESSION.get(f"{API_BASE}/health")
     assert response.status_code == 200
     print("✅ Health check passed")
     return True
@@ -49,7 +57,7 @@ def create_test_assignment():
         "rubric": rubric
     }
     
-    response = requests.post(f"{API_BASE}/assignments/", json=data)
+    response = SESSION.post(f"{API_BASE}/assignments/", json=data)
     assert response.status_code == 200
     
     assignment = response.json()
@@ -93,7 +101,7 @@ def upload_reference(assignment_id):
     
     with open(ref_file, 'rb') as f:
         files = {'file': ('reference.txt', f, 'text/plain')}
-        response = requests.post(
+        response = SESSION.post(
             f"{API_BASE}/assignments/{assignment_id}/references",
             files=files
         )
@@ -140,7 +148,7 @@ def submit_assignment(assignment_id):
     
     with open(sub_file, 'rb') as f:
         files = {'file': ('submission.txt', f, 'text/plain')}
-        response = requests.post(
+        response = SESSION.post(
             f"{API_BASE}/submissions/?assignment_id={assignment_id}",
             files=files
         )
@@ -155,24 +163,34 @@ def wait_for_grading(submission_id, max_wait=60):
     """Wait for grading to complete"""
     print(f"\n⏳ Waiting for grading to complete...")
     
-    start_time = time.time()
-    while time.time() - start_time < max_wait:
-        response = requests.get(f"{API_BASE}/submissions/{submission_id}")
-        submission = response.json()
-        
-        status = submission['status']
+    # Subscribe before reading the status so the completion can't be missed
+    pubsub = redis.Redis.from_url(REDIS_URL).pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(f"submission:{submission_id}:status")
+    
+    try:
+        response = SESSION.get(f"{API_BASE}/submissions/{submission_id}")
+        status = response.json()['status']
         print(f"   Status: {status}")
         
-        if status == 'done':
-            print("✅ Grading complete!")
-            return True
-        elif status == 'error':
-            print("❌ Grading failed")
-            return False
-        
-        time.sleep(3)
+        deadline = time.time() + max_wait
+        while status not in ('done', 'error'):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                print("⚠️  Grading timeout")
+                return False
+            
+            message = pubsub.get_message(timeout=remaining)
+            if message:
+                status = message['data'].decode()
+                print(f"   Status: {status}")
+    finally:
+        pubsub.close()
+    
+    if status == 'done':
+        print("✅ Grading complete!")
+        return True
     
-    print("⚠️  Grading timeout")
+    print("❌ Grading failed")
     return False
 
 
@@ -180,7 +198,7 @@ def get_grade(submission_id):
     """Get and display grade"""
     print(f"\n📊 Fetching grade for submission {submission_id}...")
     
-    response = requests.get(f"{API_BASE}/submissions/{submission_id}/grade")
+    response = SESSION.get(f"{API_BASE}/submissions/{submission_id}/grade")
     
     if response.status_code != 200:
         print("❌ Grade not found")